@@ -9,16 +9,110 @@ import xml.etree.ElementTree as ET
 import json
 import time
 import os
+import hashlib
 from urllib.parse import quote
 from datetime import datetime, timedelta
 from collections import Counter
 import random
 
+# arXiv namespaces, expanded once so lookups skip prefix resolution
+ATOM = '{http://www.w3.org/2005/Atom}'
+ARXIV = '{http://arxiv.org/schemas/atom}'
+
+ENTRY_TAG = f'{ATOM}entry'
+ID_TAG = f'{ATOM}id'
+TITLE_TAG = f'{ATOM}title'
+SUMMARY_TAG = f'{ATOM}summary'
+AUTHOR_TAG = f'{ATOM}author'
+NAME_TAG = f'{ATOM}name'
+CATEGORY_TAG = f'{ATOM}category'
+PUBLISHED_TAG = f'{ATOM}published'
+PRIMARY_CATEGORY_TAG = f'{ARXIV}primary_category'
+
+# Transient arXiv statuses worth retrying
+RETRY_STATUSES = (500, 502, 503, 504)
+
 class ArxivFetcher:
     def __init__(self):
         self.base_url = "http://export.arxiv.org/api/query"
         self.delay = 3  # Delay between requests (respecting API limits)
+        self._last_request = 0.0
+        self.cache_dir = "arxiv_cache"  # Complete query results, reused across runs
+        self.cache_ttl = 24 * 3600  # Seconds before a cached response is refetched
+        self.max_retries = 3  # Extra attempts on transient errors
+        
+        # One keep-alive session for every page
+        self.session = requests.Session()
+        
+    def _wait_for_slot(self):
+        """Sleep only for what remains of the delay since the previous request"""
+        elapsed = time.monotonic() - self._last_request
+        if elapsed < self.delay:
+            time.sleep(self.delay - elapsed)
+        self._last_request = time.monotonic()
+    
+    def _get(self, params):
+        """Fetch one page, retrying transient errors without breaking the request pace"""
+        for attempt in range(self.max_retries + 1):
+            # Retries go through the same slot as any request, so they are never
+            # sent sooner than the delay allows
+            self._wait_for_slot()
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=30)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return response.content
+                error = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                error = e
+            
+            print(f"    🔁 Retry {attempt + 1}/{self.max_retries} after: {error}")
+    
+    def _cache_path(self, query, max_results):
+        """Cache file for the complete result of a query"""
+        key = hashlib.sha1(json.dumps([query, max_results]).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def _read_cache(self, query, max_results):
+        """Return the cached papers of a query, or None if missing, expired or unreadable"""
+        path = self._cache_path(query, max_results)
+        try:
+            if time.time() - os.path.getmtime(path) > self.cache_ttl:
+                return None
+            with open(path, 'rb') as f:
+                papers = json.loads(f.read())
+        except OSError:
+            return None
+        except ValueError:
+            papers = None
         
+        if not isinstance(papers, list):
+            # Corrupt entry: drop it so the next run refetches instead of reusing it
+            print(f"    ⚠️  Discarding unreadable cache file {path}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        
+        return papers
+    
+    def _write_cache(self, query, max_results, papers):
+        """Store the complete result of a query, atomically, for later runs"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(query, max_results)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(papers, ensure_ascii=False, separators=(',', ':')))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"    ⚠️  Could not write cache file {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
     def fetch_by_category(self, categories, max_per_category=500, total_max=15000):
         """Retrieve papers by category with global limit"""
         print(f"🔍 Retrieval by category (max {max_per_category} per cat, {total_max} total)")
@@ -39,10 +133,6 @@ class ArxivFetcher:
             all_papers.extend(papers)
             
             print(f"    ✅ {len(papers)} papers retrieved (total: {len(all_papers)})")
-            
-            # Delay between categories
-            if i < len(categories) - 1:
-                time.sleep(self.delay)
         
         return all_papers[:total_max]
     
@@ -55,8 +145,9 @@ class ArxivFetcher:
         # Start date: X days ago
         start_date = end_date - timedelta(days=days_back)
         
-        # Format arXiv: YYYYMMDDHHMM
-        date_query = f"submittedDate:[{start_date.strftime('%Y%m%d%H%M')} TO {end_date.strftime('%Y%m%d%H%M')}]"
+        # Format arXiv: YYYYMMDDHHMM, snapped to whole days so the query
+        # (and its cached responses) stays the same across runs on a given day
+        date_query = f"submittedDate:[{start_date.strftime('%Y%m%d')}0000 TO {end_date.strftime('%Y%m%d')}2359]"
         
         return self._fetch_with_query(date_query, max_results)
     
@@ -67,6 +158,13 @@ class ArxivFetcher:
     
     def _fetch_with_query(self, query, max_results):
         """Generic method to retrieve with a query"""
+        # The whole result is cached as one unit: pages of a submittedDate-sorted
+        # feed shift as papers come in, so pages from different runs can't be mixed
+        cached = self._read_cache(query, max_results)
+        if cached is not None:
+            print(f"    📦 {len(cached)} papers from cache")
+            return cached
+        
         papers = []
         start = 0
         batch_size = min(1000, max_results)  # arXiv limits to 1000 per request
@@ -84,10 +182,11 @@ class ArxivFetcher:
             }
             
             try:
-                response = requests.get(self.base_url, params=params, timeout=30)
-                response.raise_for_status()
+                # Parsing time counts toward the delay, so only the remainder is slept
+                xml_content = self._get(params)
                 
-                batch_papers = self._parse_response(response.text)
+                # Hand raw bytes to expat instead of decoding to str first
+                batch_papers = self._parse_response(xml_content)
                 if not batch_papers:
                     print(f"    ⚠️  No results for start={start}")
                     break
@@ -97,12 +196,13 @@ class ArxivFetcher:
                 
                 print(f"    📄 Batch {len(batch_papers)} papers (total: {len(papers)})")
                 
-                # Delay between requests
-                time.sleep(self.delay)
-                
             except Exception as e:
                 print(f"    ❌ Error: {e}")
                 break
+        else:
+            # Only full sweeps are cached: an error or a (possibly transient)
+            # empty page leaves a partial result that must not be reused
+            self._write_cache(query, max_results, papers[:max_results])
         
         return papers[:max_results]
     
@@ -113,29 +213,22 @@ class ArxivFetcher:
         try:
             root = ET.fromstring(xml_content)
             
-            # arXiv Namespace
-            ns = {'atom': 'http://www.w3.org/2005/Atom',
-                  'arxiv': 'http://arxiv.org/schemas/atom'}
-            
-            entries = root.findall('atom:entry', ns)
-            
-            for entry in entries:
+            for entry in root.iterfind(ENTRY_TAG):
                 try:
                     # ID arXiv
-                    arxiv_id = entry.find('atom:id', ns).text.split('/')[-1]
+                    arxiv_id = entry.find(ID_TAG).text.split('/')[-1]
                     
                     # Titre
-                    title = entry.find('atom:title', ns).text.strip()
-                    title = ' '.join(title.split())  # Clean spaces
+                    # split() already drops leading/trailing whitespace
+                    title = ' '.join(entry.find(TITLE_TAG).text.split())  # Clean spaces
                     
                     # Résumé
-                    summary = entry.find('atom:summary', ns).text.strip()
-                    summary = ' '.join(summary.split())[:500]  # Limit size
+                    summary = ' '.join(entry.find(SUMMARY_TAG).text.split())[:500]  # Limit size
                     
                     # Auteurs
                     authors = []
-                    for author in entry.findall('atom:author', ns):
-                        name = author.find('atom:name', ns)
+                    for author in entry.iterfind(AUTHOR_TAG):
+                        name = author.find(NAME_TAG)
                         if name is not None:
                             authors.append(name.text.strip())
                     
@@ -143,20 +236,20 @@ class ArxivFetcher:
                     categories = []
                     primary_category = None
                     
-                    for category in entry.findall('atom:category', ns):
+                    for category in entry.iterfind(CATEGORY_TAG):
                         term = category.get('term')
                         if term:
                             categories.append(term)
                     
                     # Primary category
-                    primary_cat = entry.find('arxiv:primary_category', ns)
+                    primary_cat = entry.find(PRIMARY_CATEGORY_TAG)
                     if primary_cat is not None:
                         primary_category = primary_cat.get('term')
                     elif categories:
                         primary_category = categories[0]
                     
                     # Publication date
-                    published = entry.find('atom:published', ns)
+                    published = entry.find(PUBLISHED_TAG)
                     published_date = published.text if published is not None else None
                     
                     paper = {
@@ -182,8 +275,9 @@ class ArxivFetcher:
 
 def save_papers(papers, filename):
     """Save papers to JSON"""
+    # Compact json.dumps runs on the C encoder; indent (or json.dump) falls back to pure Python
     with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(papers, f, indent=2, ensure_ascii=False)
+        f.write(json.dumps(papers, ensure_ascii=False, separators=(',', ':')))
     
     size_mb = os.path.getsize(filename) / 1024 / 1024
     print(f"💾 Saved: {filename} ({len(papers)} papers, {size_mb:.1f} MB)")
@@ -9,12 +9,25 @@ import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import TruncatedSVD
+from scipy.spatial import cKDTree
+from sklearn.utils import check_random_state
+from joblib import Memory
 import umap
+from umap.umap_ import nearest_neighbors
+from umap.distances import named_distances, pairwise_special_metric
 import os
 import shutil
 from datetime import datetime
 from collections import Counter
 
+# Coordinate keys written for each projection dimension
+AXES = ('x', 'y', 'z')
+
+# On-disk cache for the expensive pure steps (embeddings, k-NN graph).
+# Entries are keyed on argument values and function code, so a new corpus
+# or parameter change recomputes automatically
+memory = Memory(".cache_umap", verbose=0)
+
 def load_papers(filename="arxiv_monthly_papers.json"):
     """Load papers from JSON file"""
     if not os.path.exists(filename):
@@ -32,24 +45,27 @@ def preprocess_papers(papers, sample_rate=5):
     """Preprocess papers and sample if necessary"""
     print(f"🔄 Preprocessing papers...")
     
-    # Filter papers with missing data
-    valid_papers = []
+    # Filter papers with missing data and sample (1 out of N) in a single pass,
+    # keeping the same papers as valid_papers[::sample_rate]
+    step = max(sample_rate, 1)
+    valid_count = 0
+    sampled_papers = []
     for paper in papers:
         if (paper.get('title') and 
             paper.get('summary') and 
             paper.get('primary_category')):
-            valid_papers.append(paper)
+            if valid_count % step == 0:
+                sampled_papers.append(paper)
+            valid_count += 1
     
-    print(f"✅ {len(valid_papers)} valid papers after filtering")
+    print(f"✅ {valid_count} valid papers after filtering")
     
-    # Sampling for performance (1 out of N)
-    if sample_rate > 1:
-        sampled_papers = valid_papers[::sample_rate]
-        print(f"📊 Sampling 1/{sample_rate}: {len(sampled_papers)} papers retained")
-        return sampled_papers
+    if step > 1:
+        print(f"📊 Sampling 1/{step}: {len(sampled_papers)} papers retained")
     
-    return valid_papers
+    return sampled_papers
 
+@memory.cache
 def create_embeddings(papers, max_features=5000, n_components=50):
     """Create TF-IDF + SVD embeddings of papers"""
     print(f"🔢 Creating embeddings (max_features={max_features}, n_components={n_components})")
@@ -69,7 +85,8 @@ def create_embeddings(papers, max_features=5000, n_components=50):
         stop_words='english',
         ngram_range=(1, 2),
         min_df=2,
-        max_df=0.95
+        max_df=0.95,
+        dtype=np.float32  # Halves the sparse matrix; SVD then runs in float32 too
     )
     
     tfidf_matrix = tfidf.fit_transform(texts)
@@ -83,7 +100,8 @@ def create_embeddings(papers, max_features=5000, n_components=50):
     print(f"  ✅ Final embeddings: {embeddings.shape}")
     print(f"  📊 Explained variance: {svd.explained_variance_ratio_.sum():.3f}")
     
-    return embeddings
+    # float32 halves the memory traffic of the k-NN search and UMAP layout
+    return embeddings.astype(np.float32, copy=False)
 
 def map_to_families(papers):
     """Map categories to 9 main scientific families"""
@@ -101,15 +119,11 @@ def map_to_families(papers):
         'nucl': 'Nuclear Physics'
     }
     
-    families = []
-    for paper in papers:
-        primary_cat = paper.get('primary_category', '')
-        if primary_cat:
-            domain = primary_cat.split('.')[0]
-            family = domain_to_family.get(domain, 'Other')
-        else:
-            family = 'Other'
-        families.append(family)
+    # partition() stops at the first '.', and a missing category maps '' to 'Other'
+    families = [
+        domain_to_family.get((paper.get('primary_category') or '').partition('.')[0], 'Other')
+        for paper in papers
+    ]
     
     family_counts = Counter(families)
     print(f"📊 Distribution by family:")
@@ -118,7 +132,39 @@ def map_to_families(papers):
     
     return families
 
-def generate_umap_projection(embeddings, families, n_neighbors=50, min_dist=0.1, spread=0.5, n_components=2):
+@memory.cache
+def compute_nearest_neighbors(embeddings, n_neighbors=50, metric='cosine'):
+    """Build the k-NN graph once so the 2D and 3D projections can share it"""
+    print(f"🔗 Nearest neighbors graph (n_neighbors={n_neighbors}, metric={metric})")
+    
+    if len(embeddings) < 4096:
+        # Below 4096 points UMAP uses exact neighbours from the full distance matrix;
+        # rebuild them the same way (its distance function, stable sort) so the
+        # projections match a fit without a precomputed graph
+        distances = pairwise_special_metric(embeddings, metric=named_distances[metric])
+        knn_indices = np.argsort(distances, axis=1, kind='mergesort')[:, :n_neighbors]
+        knn_dists = np.take_along_axis(distances, knn_indices, axis=1)
+        knn = (knn_indices, knn_dists, None)
+        print(f"✅ k-NN graph (exact): {knn_indices.shape}")
+        return knn
+    
+    # Larger corpora: the same NN-descent settings UMAP uses internally for a seeded fit
+    knn = nearest_neighbors(
+        embeddings,
+        n_neighbors=n_neighbors,
+        metric=metric,
+        metric_kwds=None,
+        angular=metric == 'cosine',
+        random_state=check_random_state(42),
+        low_memory=True,
+        n_jobs=1
+    )
+    
+    print(f"✅ k-NN graph: {knn[0].shape}")
+    return knn
+
+def generate_umap_projection(embeddings, families, n_neighbors=50, min_dist=0.1, spread=0.5, n_components=2,
+                             precomputed_knn=(None, None, None)):
     """Generate UMAP projection"""
     print(f"🎯 UMAP projection (n_neighbors={n_neighbors}, min_dist={min_dist}, spread={spread}, n_components={n_components})")
     
@@ -129,7 +175,8 @@ def generate_umap_projection(embeddings, families, n_neighbors=50, min_dist=0.1,
         spread=spread,
         n_components=n_components,
         random_state=42,
-        metric='cosine'
+        metric='cosine',
+        precomputed_knn=precomputed_knn
     )
     
     # Projection
@@ -138,63 +185,53 @@ def generate_umap_projection(embeddings, families, n_neighbors=50, min_dist=0.1,
     
     return projection
 
+def calculate_local_densities(points, percentile=20):
+    """Count, for each point, the points closer than its own distance percentile"""
+    n = len(points)
+    
+    # np.percentile interpolates between the two order statistics around this rank,
+    # so only the nearest lo + 2 neighbours are needed instead of all n distances
+    rank = percentile / 100 * (n - 1)
+    lo = int(rank)
+    k = min(lo + 2, n)
+    
+    # workers=-1 splits the queries across all cores
+    distances, _ = cKDTree(points).query(points, k=k, workers=-1)
+    threshold = distances[:, lo]
+    if lo + 1 < k:
+        threshold = threshold + (rank - lo) * (distances[:, lo + 1] - threshold)
+    
+    return np.sum(distances < threshold[:, None], axis=1)
+
 def calculate_density_weighted_centroids(projection, families, families_list):
     """Calculate density-weighted centroids"""
     print("🎯 Calculating density-weighted centroids...")
     
     centroids = {}
     
+    # Group points by family once: each family becomes a contiguous slice
+    labels = np.asarray(families)
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    sorted_points = projection[order]
+    
     for family in families_list:
         # Points of this family
-        family_mask = np.array(families) == family
-        family_points = projection[family_mask]
+        start = np.searchsorted(sorted_labels, family, side='left')
+        end = np.searchsorted(sorted_labels, family, side='right')
+        family_points = sorted_points[start:end]
         
         if len(family_points) < 30:  # Filter families too small
             continue
             
-        if projection.shape[1] == 2:  # 2D
-            # Calculate 2D density
-            densities = []
-            for point in family_points:
-                distances = np.linalg.norm(family_points - point, axis=1)
-                density = np.sum(distances < np.percentile(distances, 20))  # Local density
-                densities.append(density)
-
-            densities = np.array(densities)
-            weights = densities / densities.sum()
-
-            # Weighted centroid
-            centroid_x = np.sum(family_points[:, 0] * weights)
-            centroid_y = np.sum(family_points[:, 1] * weights)
-            
-            centroids[family] = {
-                'x': float(centroid_x),
-                'y': float(centroid_y),
-                'count': len(family_points)
-            }
-            
-        else:  # 3D
-            # Calculate 3D density
-            densities = []
-            for point in family_points:
-                distances = np.linalg.norm(family_points - point, axis=1)
-                density = np.sum(distances < np.percentile(distances, 20))
-                densities.append(density)
-
-            densities = np.array(densities)
-            weights = densities / densities.sum()
-
-            # Weighted centroid
-            centroid_x = np.sum(family_points[:, 0] * weights)
-            centroid_y = np.sum(family_points[:, 1] * weights) 
-            centroid_z = np.sum(family_points[:, 2] * weights)
-            
-            centroids[family] = {
-                'x': float(centroid_x),
-                'y': float(centroid_y), 
-                'z': float(centroid_z),
-                'count': len(family_points)
-            }
+        # Local density, used as weights for the centroid
+        densities = calculate_local_densities(family_points)
+        centroid = np.average(family_points, axis=0, weights=densities)
+        
+        centroids[family] = {
+            **{axis: float(value) for axis, value in zip(AXES, centroid)},
+            'count': len(family_points)
+        }
     
     print(f"✅ {len(centroids)} centroids calculated")
     return centroids
@@ -202,50 +239,39 @@ def calculate_density_weighted_centroids(projection, families, families_list):
 def save_visualization_data(papers, projection, families, centroids, output_prefix):
     """Save visualization data"""
     
-    # Prepare data
-    viz_data = []
-    for i, paper in enumerate(papers):
-        if projection.shape[1] == 2:  # 2D
-            point = {
-                'id': paper.get('id', f'paper_{i}'),
-                'title': paper.get('title', ''),
-                'summary': paper.get('summary', '')[:200] + '...',
-                'authors': ', '.join(paper.get('authors', [])[:3]),  # Max 3 authors
-                'category': paper.get('primary_category', ''),
-                'family': families[i],
-                'x': float(projection[i, 0]),
-                'y': float(projection[i, 1])
-            }
-        else:  # 3D
-            point = {
-                'id': paper.get('id', f'paper_{i}'),
-                'title': paper.get('title', ''),
-                'summary': paper.get('summary', '')[:200] + '...',
-                'authors': ', '.join(paper.get('authors', [])[:3]),
-                'category': paper.get('primary_category', ''),
-                'family': families[i],
-                'x': float(projection[i, 0]),
-                'y': float(projection[i, 1]),
-                'z': float(projection[i, 2])
-            }
-        viz_data.append(point)
-    
-    # Add centroids
-    viz_data_with_centroids = {
-        'points': viz_data,
-        'centroids': centroids,
-        'metadata': {
-            'total_papers': len(papers),
-            'dimensions': projection.shape[1],
-            'families': list(set(families)),
-            'generated': datetime.now().isoformat()
+    # Prepare data lazily (tolist converts every coordinate to a Python float in one pass)
+    axes = AXES[:projection.shape[1]]
+    points = (
+        {
+            'id': paper.get('id', f'paper_{i}'),
+            'title': paper.get('title', ''),
+            'summary': paper.get('summary', '')[:200] + '...',
+            'authors': ', '.join(paper.get('authors', [])[:3]),  # Max 3 authors
+            'category': paper.get('primary_category', ''),
+            'family': family,
+            **dict(zip(axes, coords))
         }
+        for i, (paper, family, coords) in enumerate(zip(papers, families, projection.tolist()))
+    )
+    
+    metadata = {
+        'total_papers': len(papers),
+        'dimensions': projection.shape[1],
+        'families': list(set(families)),
+        'generated': datetime.now().isoformat()
     }
     
-    # Save
+    # Save: points are streamed one at a time so neither the full list nor the
+    # full JSON string is held in memory. encode() keeps the C encoder fast path
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
     output_file = f"{output_prefix}.json"
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(viz_data_with_centroids, f, indent=2, ensure_ascii=False)
+        f.write('{"points":[')
+        for i, point in enumerate(points):
+            if i:
+                f.write(',')
+            f.write(encode(point))
+        f.write(f'],"centroids":{encode(centroids)},"metadata":{encode(metadata)}}}')
     
     size_mb = os.path.getsize(output_file) / 1024 / 1024
     print(f"💾 Data saved: {output_file} ({size_mb:.1f} MB)")
@@ -274,11 +300,15 @@ def main():
     
     # 5. UMAP projection generation
     
+    # The k-NN graph only depends on the embeddings, so 2D and 3D share it
+    knn = compute_nearest_neighbors(embeddings, n_neighbors=50, metric='cosine')
+    
     # UMAP 2D
     print("\n🎯 Generating 2D UMAP...")
     projection_2d = generate_umap_projection(
         embeddings, families,
-        n_neighbors=50, min_dist=0.8, spread=1.0, n_components=2
+        n_neighbors=50, min_dist=0.8, spread=1.0, n_components=2,
+        precomputed_knn=knn
     )
     
     centroids_2d = calculate_density_weighted_centroids(projection_2d, families, families_list)
@@ -293,7 +323,8 @@ def main():
     print("\n🎯 Generating 3D UMAP...")
     projection_3d = generate_umap_projection(
         embeddings, families,
-        n_neighbors=50, min_dist=0.8, spread=1.0, n_components=3
+        n_neighbors=50, min_dist=0.8, spread=1.0, n_components=3,
+        precomputed_knn=knn
     )
     
     centroids_3d = calculate_density_weighted_centroids(projection_3d, families, families_list)
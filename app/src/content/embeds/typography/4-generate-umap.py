@@ -10,8 +10,12 @@ import pandas as pd
 import json
 import os
 import glob
+import hashlib
+import re
+import sklearn
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from sklearn.preprocessing import StandardScaler
+from sklearn.decomposition import TruncatedSVD
 from datetime import datetime
 
 # Configuration
@@ -31,29 +35,69 @@ UMAP_PARAMS = {
     'random_state': 42
 }
 
-def load_png_as_matrix(png_path):
+# Pixel vectors are reduced to this many components before UMAP
+PCA_COMPONENTS = 50
+
+# Classification rules based on names
+SERIF_KEYWORDS = ['times', 'garamond', 'georgia', 'serif', 'baskerville',
+                  'caslon', 'merriweather', 'playfair', 'lora', 'crimson',
+                  'spectral', 'alegreya', 'cardo', 'vollkorn', 'gentium',
+                  'eb garamond', 'cormorant', 'libre baskerville']
+
+SCRIPT_KEYWORDS = ['script', 'cursive', 'brush', 'hand', 'dancing',
+                   'pacifico', 'satisfy', 'allura', 'tangerine', 'caveat',
+                   'sacramento', 'kaushan', 'alex brush', 'marck script']
+
+MONO_KEYWORDS = ['mono', 'code', 'courier', 'consola', 'inconsolata',
+                 'fira code', 'source code', 'jetbrains', 'roboto mono',
+                 'space mono', 'ubuntu mono', 'pt mono']
+
+DISPLAY_KEYWORDS = ['display', 'black', 'ultra', 'bebas', 'anton', 'oswald',
+                    'staatliches', 'bangers', 'fredoka', 'righteous',
+                    'russo one', 'alfa slab']
+
+# One precompiled alternation per category, checked in this order
+CATEGORY_PATTERNS = [
+    (category, re.compile('|'.join(map(re.escape, keywords))))
+    for category, keywords in [
+        ("serif", SERIF_KEYWORDS),
+        ("handwriting", SCRIPT_KEYWORDS),
+        ("monospace", MONO_KEYWORDS),
+        ("display", DISPLAY_KEYWORDS),
+    ]
+]
+
+def load_png_pixels(png_path, out=None):
     """
-    Loads a PNG and converts it to a normalized pixel matrix
+    Loads a PNG and converts it to a pixel matrix (normalized later, in bulk)
+
+    Args:
+        png_path: path to the PNG file
+        out: optional uint8 buffer of 1600 values to write the pixels into
 
     Returns:
-        numpy.array: 1D vector of 1600 dimensions (40x40 flattened)
+        numpy.array: 1D uint8 vector of 1600 dimensions (40x40 flattened)
     """
     try:
-        # Load image in grayscale
-        img = Image.open(png_path).convert('L')
+        # Load image in grayscale, closing the file as soon as it is decoded
+        with Image.open(png_path) as img:
+            if img.mode != 'L':
+                img = img.convert('L')
 
-        # Check dimensions
-        if img.size != (40, 40):
-            print(f"⚠️  Unexpected size for {png_path}: {img.size}")
-            img = img.resize((40, 40))
+            # Check dimensions
+            if img.size != (40, 40):
+                print(f"⚠️  Unexpected size for {png_path}: {img.size}")
+                img = img.resize((40, 40))
 
-        # Convert to numpy array and normalize (0-255 → 0-1)
-        pixel_matrix = np.array(img, dtype=np.float32) / 255.0
+            # Flatten to 1D vector
+            pixels = np.asarray(img, dtype=np.uint8).reshape(-1)
 
-        # Flatten to 1D vector
-        pixel_vector = pixel_matrix.flatten()
+        # Write into out if given
+        if out is None:
+            return pixels
+        out[:] = pixels
 
-        return pixel_vector
+        return out
 
     except Exception as e:
         print(f"❌ Error loading {png_path}: {e}")
@@ -73,37 +117,13 @@ def extract_font_info_from_filename(filename):
     font_id = filename.replace('.png', '').replace('_a', '')
     font_name = font_id.replace('_', ' ').title()
 
-    # Simple classification based on names
-    category = "sans-serif"  # default
-
-    # Classification rules based on names
-    serif_keywords = ['times', 'garamond', 'georgia', 'serif', 'baskerville',
-                     'caslon', 'merriweather', 'playfair', 'lora', 'crimson',
-                     'spectral', 'alegreya', 'cardo', 'vollkorn', 'gentium',
-                     'eb garamond', 'cormorant', 'libre baskerville']
-
-    script_keywords = ['script', 'cursive', 'brush', 'hand', 'dancing',
-                      'pacifico', 'satisfy', 'allura', 'tangerine', 'caveat',
-                      'sacramento', 'kaushan', 'alex brush', 'marck script']
-
-    mono_keywords = ['mono', 'code', 'courier', 'consola', 'inconsolata',
-                    'fira code', 'source code', 'jetbrains', 'roboto mono',
-                    'space mono', 'ubuntu mono', 'pt mono']
-
-    display_keywords = ['display', 'black', 'ultra', 'bebas', 'anton', 'oswald',
-                       'staatliches', 'bangers', 'fredoka', 'righteous',
-                       'russo one', 'alfa slab']
-
+    # Simple classification based on names: first matching category wins,
+    # "sans-serif" by default
     font_lower = font_name.lower()
-
-    if any(keyword in font_lower for keyword in serif_keywords):
-        category = "serif"
-    elif any(keyword in font_lower for keyword in script_keywords):
-        category = "handwriting"
-    elif any(keyword in font_lower for keyword in mono_keywords):
-        category = "monospace"
-    elif any(keyword in font_lower for keyword in display_keywords):
-        category = "display"
+    category = next(
+        (name for name, pattern in CATEGORY_PATTERNS if pattern.search(font_lower)),
+        "sans-serif"
+    )
 
     # Générer l'URL Google Fonts (utiliser le nom avec majuscules)
     google_fonts_url = f"https://fonts.google.com/specimen/{font_name.replace(' ', '+')}"
@@ -115,50 +135,119 @@ def extract_font_info_from_filename(filename):
         "google_fonts_url": google_fonts_url
     }
 
-def load_all_font_data():
+def load_font_png(png_path, out=None):
     """
-    Loads all font data from PNGs
+    Loads font info and raw pixels for a single PNG
 
     Returns:
-        tuple: (font_data_list, pixel_matrices)
+        tuple: (font_info, pixels), pixels is None on failure
     """
-    print("🔄 Loading font data from PNGs...")
+    font_info = extract_font_info_from_filename(os.path.basename(png_path))
+    return font_info, load_png_pixels(png_path, out)
 
-    # Create data folder if necessary
-    os.makedirs(DATA_DIR, exist_ok=True)
+def list_png_files():
+    """
+    Finds all glyph PNGs, sorted so the order (and input hash) is stable
 
-    # Find all PNG files
+    Returns:
+        list: PNG file paths
+    """
     png_pattern = os.path.join(PNGS_DIR, "*_a.png")
-    png_files = glob.glob(png_pattern)
+    png_files = sorted(glob.glob(png_pattern))
 
     if not png_files:
         raise FileNotFoundError(f"No PNG files found in {PNGS_DIR}")
 
-    print(f"📁 Found {len(png_files)} PNG files")
+    return png_files
 
-    font_data_list = []
-    pixel_matrices = []
+def compute_input_hash(png_files):
+    """
+    Hashes the PNG names and contents together with everything else that
+    shapes the output: this script's source (parameters, keyword lists,
+    preprocessing) and the umap-learn / scikit-learn versions
 
-    for i, png_path in enumerate(png_files):
-        filename = os.path.basename(png_path)
+    Returns:
+        str: hex digest identifying the inputs of the embedding
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    versions = {"umap": umap.__version__, "sklearn": sklearn.__version__}
+    digest.update(json.dumps(versions, sort_keys=True).encode('utf-8'))
 
-        # Extract font info
-        font_info = extract_font_info_from_filename(filename)
+    with open(os.path.abspath(__file__), 'rb') as f:
+        source = f.read()
+    digest.update(len(source).to_bytes(8, 'little'))
+    digest.update(source)
 
-        # Load pixel matrix
-        pixel_matrix = load_png_as_matrix(png_path)
+    for png_path in png_files:
+        with open(png_path, 'rb') as f:
+            content = f.read()
+        digest.update(os.path.basename(png_path).encode('utf-8') + b'\0')
+        digest.update(len(content).to_bytes(8, 'little'))
+        digest.update(content)
 
-        if pixel_matrix is not None:
-            font_data_list.append(font_info)
-            pixel_matrices.append(pixel_matrix)
+    return digest.hexdigest()
 
-            if (i + 1) % 50 == 0:
-                print(f"⚡ Processed {i + 1}/{len(png_files)} fonts...")
+def load_previous_input_hash():
+    """
+    Reads the input hash stored by the previous run, if any
+
+    Returns:
+        str or None: stored hash
+    """
+    try:
+        with open(FULL_OUTPUT_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    metadata = data.get("metadata") if isinstance(data, dict) else None
+    if not isinstance(metadata, dict):
+        return None
+    return metadata.get("input_hash")
+
+def load_all_font_data(png_files):
+    """
+    Loads all font data from PNGs
+
+    Args:
+        png_files: PNG file paths, as returned by list_png_files
+
+    Returns:
+        tuple: (font_data_list, pixel_matrices)
+    """
+    print("🔄 Loading font data from PNGs...")
+
+    # Create data folder if necessary
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    print(f"📁 Found {len(png_files)} PNG files")
+
+    font_data_list = []
+
+    # Each PNG is decoded straight into its own row of a preallocated uint8 matrix
+    raw_pixels = np.empty((len(png_files), 1600), dtype=np.uint8)
+    loaded = np.zeros(len(png_files), dtype=bool)
+
+    # PIL releases the GIL while decoding, so PNGs are loaded on a thread pool
+    # (map keeps the original file order)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(load_font_png, png_files, raw_pixels)
+        for i, (font_info, pixels) in enumerate(results):
+            if pixels is not None:
+                font_data_list.append(font_info)
+                loaded[i] = True
+
+                if (i + 1) % 50 == 0:
+                    print(f"⚡ Processed {i + 1}/{len(png_files)} fonts...")
 
     print(f"✅ Loaded {len(font_data_list)} fonts successfully")
 
-    # Convert to numpy array
-    pixel_matrices = np.array(pixel_matrices)
+    # Drop the rows of PNGs that failed to load (only copies if any did)
+    if not loaded.all():
+        raw_pixels = raw_pixels[loaded]
+
+    # Normalize (0-255 → 0-1) in a single pass over the whole matrix
+    pixel_matrices = np.divide(raw_pixels, np.float32(255.0), dtype=np.float32)
     print(f"📊 Final matrix: {pixel_matrices.shape} ({pixel_matrices.shape[0]} fonts × {pixel_matrices.shape[1]} pixels)")
 
     return font_data_list, pixel_matrices
@@ -168,17 +257,30 @@ def generate_umap_embedding(pixel_matrices):
     Generates UMAP embeddings from pixel matrices
 
     Args:
-        pixel_matrices: numpy array (n_fonts, 1600)
+        pixel_matrices: float32 numpy array (n_fonts, 1600), normalized in place
 
     Returns:
         numpy.array: 2D UMAP coordinates
     """
     print("🔄 Generating UMAP embeddings...")
 
-    # Normalize data (important for UMAP)
+    # Normalize data (important for UMAP): per-pixel zero mean and unit variance,
+    # done in place in float32 rather than through a float64 StandardScaler copy
     print("📊 Normalizing data...")
-    scaler = StandardScaler()
-    normalized_data = scaler.fit_transform(pixel_matrices)
+    normalized_data = pixel_matrices
+    mean = normalized_data.mean(axis=0)
+    std = normalized_data.std(axis=0)
+    std[std < 10 * np.finfo(std.dtype).eps] = 1.0  # Constant pixels are left unscaled
+    normalized_data -= mean
+    normalized_data /= std
+
+    # Reduce the 1600 pixel dimensions before UMAP so neighbour search runs on
+    # PCA_COMPONENTS dims; the data is already centered, so truncated SVD is PCA
+    if min(normalized_data.shape) > PCA_COMPONENTS:
+        print(f"📉 Reducing to {PCA_COMPONENTS} components...")
+        svd = TruncatedSVD(n_components=PCA_COMPONENTS, random_state=UMAP_PARAMS['random_state'])
+        normalized_data = svd.fit_transform(normalized_data)
+        print(f"📊 Explained variance: {svd.explained_variance_ratio_.sum():.1%}")
 
     # Apply UMAP
     print(f"🗺️  Applying UMAP with parameters: {UMAP_PARAMS}")
@@ -191,21 +293,22 @@ def generate_umap_embedding(pixel_matrices):
 
     return embedding
 
-def save_typography_data(font_data_list, embedding):
+def save_typography_data(font_data_list, embedding, input_hash=None):
     """
     Saves final data in JSON format
+
+    Args:
+        input_hash: hash of the inputs, stored so unchanged reruns can be skipped
     """
     print("💾 Saving data...")
 
-    # Combine font data and UMAP coordinates
-    final_data = []
-    for i, font_info in enumerate(font_data_list):
-        font_data = {
-            **font_info,
-            "x": float(embedding[i, 0]),
-            "y": float(embedding[i, 1])
-        }
-        final_data.append(font_data)
+    # Combine font data and UMAP coordinates (tolist converts to Python floats in one pass)
+    xs = embedding[:, 0].tolist()
+    ys = embedding[:, 1].tolist()
+    final_data = [
+        {**font_info, "x": x, "y": y}
+        for font_info, x, y in zip(font_data_list, xs, ys)
+    ]
 
     # Metadata
     metadata = {
@@ -213,7 +316,9 @@ def save_typography_data(font_data_list, embedding):
         "method": "umap_from_png_pixels",
         "total_fonts": len(final_data),
         "umap_params": UMAP_PARAMS,
-        "data_source": "PNG pixel matrices (40x40)"
+        "pca_components": PCA_COMPONENTS,
+        "data_source": "PNG pixel matrices (40x40)",
+        "input_hash": input_hash
     }
 
     # Final structure
@@ -222,9 +327,9 @@ def save_typography_data(font_data_list, embedding):
         "fonts": final_data
     }
 
-    # Save
+    # Save (compact one-shot dumps goes through the C encoder, unlike indented json.dump)
     with open(FULL_OUTPUT_PATH, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=2, ensure_ascii=False)
+        f.write(json.dumps(output_data, ensure_ascii=False, separators=(',', ':')))
 
     print(f"✅ Data saved to {FULL_OUTPUT_PATH}")
 
@@ -243,14 +348,21 @@ def main():
     print("🎨 UMAP generation for typography from pixel matrices\n")
 
     try:
-        # 1. Load font data
-        font_data_list, pixel_matrices = load_all_font_data()
+        # 1. Skip the run if PNGs and code are unchanged since the last output
+        png_files = list_png_files()
+        input_hash = compute_input_hash(png_files)
+        if load_previous_input_hash() == input_hash:
+            print(f"✅ {FULL_OUTPUT_PATH} is up to date (delete it to force a rebuild)")
+            return
+
+        # 2. Load font data
+        font_data_list, pixel_matrices = load_all_font_data(png_files)
 
-        # 2. Generate UMAP embeddings
+        # 3. Generate UMAP embeddings
         embedding = generate_umap_embedding(pixel_matrices)
 
-        # 3. Save results
-        save_typography_data(font_data_list, embedding)
+        # 4. Save results
+        save_typography_data(font_data_list, embedding, input_hash)
 
         print("\n🎉 UMAP generation completed successfully!")
 